@@ -1,16 +1,24 @@
+import array
+import itertools
+import logging
 import re
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional
 import TexSoup
+from TexSoup.data import TexNode as _TexNode
 
 
-IGNORED_NODES = {
+logger = logging.getLogger(__name__)
+
+
+IGNORED_NODES = frozenset({
     # Table components
     'toprule',
     'midrule',
     'bottomrule',
     'endhead'
-}
-TEXT_NODES = {
+})
+TEXT_NODES = frozenset({
     'underline',
     'textsubscript',
     'textsuperscript',
@@ -22,8 +30,8 @@ TEXT_NODES = {
     'bf',
     'sc',
     'tt'
-}
-SECTION_NODES = {
+})
+SECTION_NODES = frozenset({
     'section',
     'section*',
     'subsection',
@@ -32,7 +40,146 @@ SECTION_NODES = {
     'subsubsection*',
     'paragraph',
     'paragraph*'
+})
+# Nodes that depend on or update the converter's bookkeeping
+BOOKKEEPING_NODES = SECTION_NODES | frozenset({
+    'footnote',
+    'label'
+})
+
+# Single characters that do not take part in any other replacement
+# are substituted before the stages below. str.replace finds them with
+# a fast character search, which beats both the regex engine and
+# str.translate (the latter has no fast path for non-ASCII text).
+preprocessing_chars = {
+    '~': '&nbsp;'
+}
+postprocessing_chars = {
+    '`': '‘',
+    "'": '’'
+}
+
+# Replacements are applied in stages, each stage being a single pass over
+# the text. The result must be the same as that of applying the
+# replacements one by one in table order, which src/tests.py checks.
+# A single pass does not rescan its own output, so a key must be in a
+# later stage than any key before it whose output it can match, alone or
+# together with the neighbouring text. E.g., ' —' should also catch dashes
+# produced from '---' and ' -- ', and '\\_' should catch the '\\_&gt;' that
+# ' \\textgreater' makes of '\\ \\textgreater'.
+preprocessing_stages = [
+    {
+        # Preserve intentional spaces
+        '\\textless{} ': '&lt;_',
+        '\\textless{}': '&lt;',
+        '\\textless ': '&lt;_',
+        '\\textless': '&lt;',
+        ' \\textgreater{}': '_&gt;',
+        '\\textgreater{}': '&gt;',
+        ' \\textgreater': '_&gt;',
+        '\\textgreater': '&gt;',
+        '\\ldots{}': '…',
+        '\\ldots': '…',
+        '\\#': '#',
+        '---': '—'
+    },
+    {
+        '\\_': '_',
+        ' -- ': ' — ',
+        '--': '–'
+    },
+    {
+        ' —': '&nbsp;—'
+    }
+]
+postprocessing_stages = [
+    {
+        '> .': '>.',
+        '&gt; .': '&gt;.',
+        '> »': '>»',
+        '&gt; »': '&gt;»',
+        '> ,': '>,',
+        '&gt; ,': '&gt;,',
+        '> ;': '>;',
+        '&gt; ;': '&gt;;',
+        '> ?': '>?',
+        '&gt; ?': '&gt;?',
+        '> !': '>!',
+        '&gt; !': '&gt;!',
+        '> )': '>)',
+        '&gt; )': '&gt;)',
+        '( <': '(<',
+        '( &lt;': '(&lt;',
+        '* <': '*<',
+        '* &lt;': '*&lt;',
+        "&nbsp; ": '&nbsp;',
+        '[</span> ': '[</span>',
+        ' <span class="BraceGroup">]': '<span class="BraceGroup">]',
+        ' <span id="foot': '<span id="foot',
+        '[ ': '[',
+        ' ]': ']',
+        '( ': '(',
+        ' )': ')'
+    },
+    {
+        '&lt; ': '&lt;',
+        ' &gt;': '&gt;',
+        '<sup>?</sup> ': '<sup>?</sup>'
+    },
+    {
+        # Restore intentional spaces
+        '&lt;_': '&lt; ',
+        '_&gt;': ' &gt;'
+    }
+]
+
+
+def _compile_replacement_stages(stages):
+    # Longer keys go first, so that, e.g., '\\textless{}' is not
+    # shadowed by '\\textless' and '---' is not shadowed by '--'.
+    return [
+        (re.compile('|'.join([re.escape(k) for k in sorted(stage, key=len, reverse=True)])),
+         stage)
+        for stage in stages
+    ]
+
+
+_PRE_RES = _compile_replacement_stages(preprocessing_stages)
+_POST_RES = _compile_replacement_stages(postprocessing_stages)
+
+# Blocks are separated by 2+ line breaks.
+_BLOCK_SPLIT_RE = re.compile(r'[\n\r]{2,}')
+# Blocks starting with these commands are not converted as regular
+# LaTeX: glossed examples and the table of contents. More special cases
+# will certainly turn up.
+_SPECIAL_BLOCK_COMMANDS = ('\\ex', '\\tableofcontents')
+
+# Opening and closing tags for inline markup commands that can be
+# converted without TexSoup when their argument is plain text.
+_INLINE_TAGS = {
+    'textsuperscript': ('<sup>', '</sup>'),
+    'textsubscript': ('<sub>', '</sub>'),
+    'underline': ('<span class="underline">', '</span>'),
+    'textit': ('<span class="textit">', '</span>'),
+    'textbf': ('<span class="textbf">', '</span>'),
+    'textsc': ('<span class="textsc">', '</span>'),
+    'texttt': ('<span class="texttt">', '</span>')
 }
+# Tag pairs for all markup nodes rendered as a pair of tags. Nodes
+# not known in advance become spans, whose tags are added here the
+# first time the node name is seen.
+_MARKUP_TAGS = dict(_INLINE_TAGS)
+# Footnote anchors in the text and footnotes themselves, which are
+# collected at the end of the document.
+_FOOTNOTE_ANCHOR = '<span id="footnoteanchor{n}"><sup><a href="#footnote{n}">{n}</a></sup></span>'
+_FOOTNOTE_BODY = '<div id="footnote{n}" class="footnote"><sup><a href="#footnoteanchor{n}">{n}</a></sup> {body}</div>'
+# The opening of a command's argument, an escaped square bracket, the
+# end of an argument, a run of plain text, or any other character, which
+# makes the block ineligible for the fast path.
+_SIMPLE_TOKEN_RE = re.compile(
+    r'\\([A-Za-z]+)\{|\{([\[\]])\}|(\})|([^\\{}$%\[\]]+)|(.)', re.DOTALL)
+# TexSoup takes a group following a command as another argument
+_ARGUMENT_AHEAD_RE = re.compile(r'\s*[{\[]')
 
 
 class TOCNode:
@@ -48,6 +195,10 @@ class TOC:
 
     def __init__(self) -> None:
         self.children = []
+        # The last element added on each level, starting with
+        # the root, i.e. the current candidate parent for the
+        # next level down.
+        self._level_cursor = [self]
 
     def _add_to_level(self, level: int, node: TOCNode) -> None:
         '''
@@ -60,13 +211,11 @@ class TOC:
         if level < 1:
             raise ValueError(
                 f'Incorrect level value: {level}; levels should be greater than or equal to 1.')
-        current_root = self
-        while level > 1:
-            if not current_root.children:
-                raise IndexError('No suitable parent found!')
-            current_root = current_root.children[-1]
-            level -= 1
-        current_root.children.append(node)
+        if level > len(self._level_cursor):
+            raise IndexError('No suitable parent found!')
+        self._level_cursor[level - 1].children.append(node)
+        # Deeper levels now have to start under the new node.
+        self._level_cursor[level:] = [node]
 
     def add_section(self, node: TOCNode) -> None:
         self._add_to_level(1, node)
@@ -89,41 +238,43 @@ class Tex2HTMLConverter:
     Tex commands are treated as paragraphs of text.
     '''
 
-    def __init__(self, tex_string: str) -> None:
-        # Bookkeeping
-        self.TOC = TOC()
-        self.section_counter = 1
-        self.subsection_counter = 1
-        self.subsubsection_counter = 1
-        self.paragraph_counter = 1
-        self.example_counter = 1
-        self.figure_counter = 1
-        self.table_counter = 1
-        self.footnotes = []
-        self.label_replacement_dict = {}
-        self.last_generated_label = None
+    def __init__(self, tex_string: str, workers: Optional[int] = None) -> None:
+        # If set, blocks that do not touch the bookkeeping are converted
+        # in a pool of this many worker processes.
+        self.workers = workers
+        self.__reset_bookkeeping()
 
         # We need this step to cleanly take care of paragraphs
         # and other elements, such as \ex. blocks, that TexSoup
         # does not handle correctly.
-        self.blocks = re.split(r'[\n\r]{2,}', preprocess(tex_string))
+        self.blocks = _BLOCK_SPLIT_RE.split(preprocess(tex_string))
 
-        # End result
+        # End result; the conversion is done lazily, so that the
+        # output can also be streamed with write_to.
         self.HTML_arr = None
-        self.__convert()
-
-    # Helper methods for resetting counters
-
-    def __start_new_section(self) -> None:
-        self.subsection_counter = 1
-        self.__start_new_subsection()
 
-    def __start_new_subsection(self) -> None:
-        self.subsubsection_counter = 1
-        self.__start_new_subsubsection()
+    def __reset_bookkeeping(self) -> None:
+        self.TOC = TOC()
+        # Section, subsection, subsubsection, and paragraph counters
+        self._counters = array.array('i', [1, 1, 1, 1])
+        # Numbers of the current section and subsection, with which
+        # the numbers of headings on the next level start (e.g., '2.3.')
+        self._number_prefixes = ['', '0.', '0.0.']
+        self.example_counter = 1
+        self.figure_counter = 1
+        self.table_counter = 1
+        self.footnotes = []
+        self.label_replacement_dict = {}
+        self.last_generated_label = None
 
-    def __start_new_subsubsection(self) -> None:
-        self.paragraph_counter = 1
+    def __reset_counters_at_level(self, level: int) -> None:
+        '''
+        Restarts the numbering of all levels below the given one
+        (1 for sections, 2 for subsections, etc.).
+        '''
+        counters = self._counters
+        for i in range(level, len(counters)):
+            counters[i] = 1
 
     def get_tree(self) -> TexSoup.data.TexNode:
         return self.tex_tree
@@ -131,180 +282,303 @@ class Tex2HTMLConverter:
     def __convert(self) -> None:
         if self.HTML_arr is not None:
             return
-        result = []
-        for block in self.blocks:
-            if block.startswith('\\ex'):
+        self.HTML_arr = list(self._iter_HTML())
+
+    def _iter_HTML(self) -> Iterator[str]:
+        '''
+        Converts the blocks one by one and yields their HTML followed
+        by the footnotes. Every call starts a new conversion, so the
+        bookkeeping is reset first.
+        '''
+        self.__reset_bookkeeping()
+        if self.workers is None:
+            yield from self.__iter_blocks_HTML(itertools.repeat(None))
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                yield from self.__iter_blocks_HTML(executor.map(
+                    Tex2HTMLConverter._convert_stateless_block,
+                    self.blocks,
+                    chunksize=16))
+        for footnote in self.footnotes:
+            yield postprocess(footnote)
+        logger.debug('Label replacements: %s', self.label_replacement_dict)
+
+    def __iter_blocks_HTML(self, converted_blocks) -> Iterator[str]:
+        '''
+        converted_blocks holds the HTML for the blocks that were
+        converted beforehand and None for the rest.
+        '''
+        for block, block_HTML in zip(self.blocks, converted_blocks):
+            special_block = _get_special_block_command(block)
+            if special_block == '\\ex':
                 # A glossed example; we use a custom parser for this
-                result.append(convert_example(block, self.example_counter))
+                yield convert_example(block, self.example_counter)
                 self.example_counter += 1
-            elif block.startswith('\\tableofcontents'):
+            elif special_block == '\\tableofcontents':
                 # To be replaced with the actual TOC
                 # after parsing is done
-                result.append('<p>TOC</p>')
-            # More special cases will certainly turn up
+                yield '<p>TOC</p>'
+            elif block_HTML is not None:
+                yield block_HTML
             else:
-                result.append(postprocess(self.__convert_block(block)))
-        self.HTML_arr = result
-        for footnote in self.footnotes:
-            self.HTML_arr.append(postprocess(footnote))
-        print(self.label_replacement_dict)
+                result = []
+                self.__convert_block(block, result)
+                yield postprocess(''.join(result))
+
+    # The instance converting stateless blocks in a worker process; it is
+    # created on first use, once per process, as these blocks never touch
+    # its bookkeeping.
+    _stateless_converter = None
 
-    def __convert_block(self, block, already_parsed=False) -> str:
+    @classmethod
+    def _convert_stateless_block(cls, block: str) -> Optional[str]:
+        '''
+        Converts a block independently of the rest of the document, so
+        that this can be done in a worker process. None is returned for
+        blocks that depend on or update the bookkeeping (examples, the TOC,
+        headings, footnotes, labels); these are left to the main instance,
+        which converts them in document order.
+        '''
+        if _get_special_block_command(block) is not None:
+            return None
+        simple_paragraph = convert_simple_paragraph(block)
+        if simple_paragraph is not None:
+            return postprocess(''.join(simple_paragraph))
+        tree = TexSoup.TexSoup(block)
+        for node in tree.descendants:
+            if isinstance(node, _TexNode) and node.name in BOOKKEEPING_NODES:
+                return None
+        converter = cls._stateless_converter
+        if converter is None:
+            converter = cls._stateless_converter = cls('')
         result = []
+        converter.__convert_nodes(tree.contents, result)
+        return postprocess(''.join(result))
+
+    def __convert_block(self, block, result, already_parsed=False) -> None:
+        '''
+        Appends the block's HTML to result as a list of fragments; joining
+        them is left to the outermost caller, so that nested blocks (e.g.,
+        list items) do not produce intermediate strings. A pre-parsed block
+        is a single node, such as an element of a list item.
+        '''
         # The block represents some LaTeX environment or a paragraph.
         if already_parsed:
-            tree = block
-        else:
-            tree = TexSoup.TexSoup(block)
+            self.__convert_nodes((block,), result, paragraph=False)
+            return
+        simple_paragraph = convert_simple_paragraph(block)
+        if simple_paragraph is not None:
+            result.extend(simple_paragraph)
+            return
+        self.__convert_nodes(TexSoup.TexSoup(block).contents, result)
+
+    def __convert_nodes(self, nodes, result, paragraph=True) -> None:
         # Is this a text node or one of special node types?
-        first_node = tree.contents[0]
-        if type(first_node) != TexSoup.data.TexNode or first_node.name in TEXT_NODES:
+        first_node = nodes[0]
+        if not isinstance(first_node, _TexNode) or first_node.name in TEXT_NODES:
             # Do not add paragraph tags for pre-parsed elements.
-            if not already_parsed:
+            if paragraph:
                 result.append('<p>')
-            tmp = []
-            self.__process_text_tree(tree, tmp)
-            result.extend(tmp)
-            if not already_parsed:
-                result.append('</p>')
+                self.__process_text_nodes(nodes, result, separate=True)
+                result.append(' </p>')
+            else:
+                self.__process_text_nodes(nodes, result)
         elif first_node.name == 'BraceGroup':
             # An escape sequence
             result.append(first_node.contents[0])
         elif first_node.name in SECTION_NODES:
-            tmp = []
-            self.__process_text_tree(tree, tmp)
-            result.extend(tmp)
+            self.__process_text_nodes(nodes, result)
         elif first_node.name == 'itemize':
-            result.append(self.itemize(first_node))
+            self.itemize(first_node, result)
         elif first_node.name == 'enumerate':
-            result.append(self.enumerate(first_node))
+            self.enumerate(first_node, result)
         else:
             result.append(first_node.name)
-        return ' '.join(result)
 
-    def __process_text_tree(self, tree, result):
+    def __process_text_nodes(self, nodes, result, separate=False):
         """
-        process_text_tree iterates over the tree's contents, adds text nodes, and
-        recursively expands and adds contents of simple markup nodes. It does not
+        process_text_nodes iterates over a node's contents, adds text nodes, and
+        expands and adds contents of simple markup nodes. It does not
         expect to see nodes that cannot be dealt with by specifying a pair of opening
         and closing tags, except for footnotes, which are replaced with a footnote anchor.
         The text of the footnote itself is stored for later.
+
+        Fragments are appended to result as they are produced, and the caller joins
+        them once. Sibling fragments are separated by single spaces; if separate
+        is set, the first one is separated from what is already in result as well.
+
+        Nested markup is walked with an explicit stack instead of recursion, so
+        that deeply nested inline tags do not cost a Python call per level.
         """
-        for node in tree.contents:
-            if type(node) != TexSoup.data.TexNode:
-                try:
-                    result.append(node.text.strip())
-                except AttributeError:
-                    result.append(node.strip())
-            else:
-                tmp = []
-                self.__process_text_tree(node, tmp)
-                if node.name == 'label':
+        # Local aliases for the lookups done for every node
+        append = result.append
+        get_handler = self._TEXT_TREE_HANDLERS.get
+        # Suspended iterators over the contents of the enclosing nodes,
+        # each paired with the fragment closing its node
+        stack = []
+        nodes = iter(nodes)
+        while True:
+            for node in nodes:
+                if not isinstance(node, _TexNode):
+                    if separate:
+                        append(' ')
+                    separate = True
+                    try:
+                        append(node.text.strip())
+                    except AttributeError:
+                        append(node.strip())
+                    continue
+                name = node.name
+                if name == 'label':
                     self.label_replacement_dict[node.text[0]
                                                 ] = self.last_generated_label
-                elif node.name == 'footnote':
-                    footnote_no = len(self.footnotes) + 1
-                    result.append(
-                        f'<span id="footnoteanchor{footnote_no}"><sup><a href="#footnote{footnote_no}">{footnote_no}</a></sup></span>')
-                    self.footnotes.append(
-                        f'<div id="footnote{footnote_no}" class="footnote"><sup><a href="#footnoteanchor{footnote_no}">{footnote_no}</a></sup> ' + ' '.join(tmp) + '</div>')
-                elif node.name == 'textsuperscript':
-                    result.append(
-                        f'<sup>' + ' '.join(tmp) + '</sup>')
-                elif node.name == 'textsubscript':
-                    result.append(
-                        f'<sub>' + ' '.join(tmp) + '</sub>')
-                elif node.name == 'textbackslash':
-                    result.append('\\')
-                elif node.name == 'section':
-                    result.append(self.section(node))
-                elif node.name == 'section*':
-                    result.append(self.section(node, starred=True))
-                elif node.name == 'subsection':
-                    result.append(self.subsection(node))
-                elif node.name == 'subsection*':
-                    result.append(self.subsection(node, starred=True))
-                elif node.name == 'subsubsection':
-                    result.append(self.subsubsection(node))
-                elif node.name == 'subsubsection*':
-                    result.append(self.subsubsection(node, starred=True))
-                # TODO: paragraph
+                    continue
+                if separate:
+                    append(' ')
+                separate = True
+                handler = get_handler(name)
+                if handler is None:
+                    closing = self.__wrap_markup(node, result)
                 else:
-                    result.append(
-                        f'<span class="{node.name}">' + ' '.join(tmp) + '</span>')
+                    closing = handler(self, node, result)
+                if closing is not None:
+                    # Descend into the node's contents
+                    stack.append((nodes, closing))
+                    nodes = iter(node.contents)
+                    separate = False
+                    break
+            else:
+                if not stack:
+                    return
+                # Contents exhausted: close the node and resume its parent
+                nodes, closing = stack.pop()
+                append(closing)
+                separate = True
+
+    # Handlers for markup nodes inside text trees. A handler appends what
+    # precedes the node's contents and returns the fragment that should
+    # follow them, or None if it has dealt with the contents itself.
+
+    def __wrap_markup(self, node, result):
+        tags = _MARKUP_TAGS.get(node.name)
+        if tags is None:
+            tags = _MARKUP_TAGS[node.name] = (
+                f'<span class="{node.name}">', '</span>')
+        result.append(tags[0])
+        return tags[1]
+
+    def __handle_footnote(self, node, result):
+        # The footnote's text is rendered at the end of result and then
+        # cut off, so that no separate list is needed for it.
+        mark = len(result)
+        self.__process_text_nodes(node.contents, result)
+        body = ''.join(result[mark:])
+        del result[mark:]
+        footnote_no = len(self.footnotes) + 1
+        result.append(_FOOTNOTE_ANCHOR.format(n=footnote_no))
+        self.footnotes.append(
+            _FOOTNOTE_BODY.format(n=footnote_no, body=body))
+
+    def __handle_backslash(self, node, result):
+        result.append('\\')
+
+    def __handle_section(self, node, result):
+        self.section(node, result, starred=node.name.endswith('*'))
+
+    def __handle_subsection(self, node, result):
+        self.subsection(node, result, starred=node.name.endswith('*'))
+
+    def __handle_subsubsection(self, node, result):
+        self.subsubsection(node, result, starred=node.name.endswith('*'))
+
+    # TODO: paragraph
+    _TEXT_TREE_HANDLERS = {
+        'footnote': __handle_footnote,
+        'textbackslash': __handle_backslash,
+        'section': __handle_section,
+        'section*': __handle_section,
+        'subsection': __handle_subsection,
+        'subsection*': __handle_subsection,
+        'subsubsection': __handle_subsubsection,
+        'subsubsection*': __handle_subsubsection
+    }
 
     # Coverters for individual tags
 
-    def section(self, node, starred=False):
+    def section(self, node, result, starred=False):
         if not starred:
-            section_no = self.section_counter
-            section_id = f'section-{section_no}'
+            section_no = self._counters[0]
+            number = str(section_no)
+            self._number_prefixes[1] = number + '.'
+            self._number_prefixes[2] = number + '.0.'
+            section_id = 'section-' + number
             self.last_generated_label = section_id
-            self.section_counter += 1
-            self.__start_new_section()
+            self._counters[0] += 1
+            self.__reset_counters_at_level(1)
             section_id_attribute = f' id="{section_id}"'
-            prefix = f'{section_no} '
+            prefix = number + ' '
         else:
             # Starred sections get no ids and cannot be referenced.
             section_id_attribute = ''
             prefix = ''
-        tmp = []
-        self.__process_text_tree(node, tmp)
-        return f'<div class="section"{section_id_attribute}>{prefix}{" ".join(tmp)}</div>'
+        result.append(f'<div class="section"{section_id_attribute}>{prefix}')
+        self.__process_text_nodes(node.contents, result)
+        result.append('</div>')
 
-    def subsection(self, node, starred=False):
+    def subsection(self, node, result, starred=False):
         if not starred:
-            subsection_no = self.subsection_counter
-            subsection_id = f'subsection-{self.section_counter-1}.{subsection_no}'
+            subsection_no = self._counters[1]
+            number = self._number_prefixes[1] + str(subsection_no)
+            self._number_prefixes[2] = number + '.'
+            subsection_id = 'subsection-' + number
             self.last_generated_label = subsection_id
-            self.subsection_counter += 1
-            self.__start_new_subsection()
+            self._counters[1] += 1
+            self.__reset_counters_at_level(2)
             subsection_id_attribute = f' id="{subsection_id}"'
-            prefix = f'{self.section_counter-1}.{subsection_no} '
+            prefix = number + ' '
         else:
             # Starred sections get no ids and cannot be referenced.
             subsection_id_attribute = ''
             prefix = ''
-        tmp = []
-        self.__process_text_tree(node, tmp)
-        return f'<div class="subsection"{subsection_id_attribute}>{prefix}{" ".join(tmp)}</div>'
+        result.append(f'<div class="subsection"{subsection_id_attribute}>{prefix}')
+        self.__process_text_nodes(node.contents, result)
+        result.append('</div>')
 
-    def subsubsection(self, node, starred=False):
+    def subsubsection(self, node, result, starred=False):
         if not starred:
-            subsubsection_no = self.subsubsection_counter
-            subsubsection_id = f'subsubsection-{self.section_counter-1}.{self.subsection_counter-1}.{subsubsection_no}'
+            subsubsection_no = self._counters[2]
+            number = self._number_prefixes[2] + str(subsubsection_no)
+            subsubsection_id = 'subsubsection-' + number
             self.last_generated_label = subsubsection_no
-            self.subsubsection_counter += 1
-            self.__start_new_subsubsection()
+            self._counters[2] += 1
+            self.__reset_counters_at_level(3)
             subsubsection_id_attribute = f' id="{subsubsection_id}"'
-            prefix = f'{self.section_counter-1}.{self.subsection_counter-1}.{subsubsection_no} '
+            prefix = number + ' '
         else:
             # Starred sections get no ids and cannot be referenced.
             subsubsection_id_attribute = ''
             prefix = ''
-        tmp = []
-        self.__process_text_tree(node, tmp)
-        return f'<div class="subsubsection"{subsubsection_id_attribute}>{prefix}{" ".join(tmp)}</div>'
-
-    def paragraph(self, contents, starred=False):
-        pass
+        result.append(f'<div class="subsubsection"{subsubsection_id_attribute}>{prefix}')
+        self.__process_text_nodes(node.contents, result)
+        result.append('</div>')
 
-    def itemize(self, node):
-        result = []
+    def itemize(self, node, result):
+        result.append('<ul>')
+        separator = ''
         for child in node.children:
             # Each child is an item
-            tmp = []
-            for item_element in child.contents:
+            result.append(f'{separator}<li>')
+            separator = ' '
+            for i, item_element in enumerate(child.contents):
                 # This can be either a text node or an embedded environment.
                 # self.__convert_block can take care of either.
-                item_tree = empty_tree()
-                item_tree.append(item_element)
-                tmp.append(self.__convert_block(item_tree, True))
-            result.append(f'<li>{" ".join(tmp)}</li>')
-        return f'<ul>{" ".join(result)}</ul>'
+                if i:
+                    result.append(' ')
+                self.__convert_block(item_element, result, True)
+            result.append('</li>')
+        result.append('</ul>')
 
-    def enumerate(self, node):
-        result = []
+    def enumerate(self, node, result):
         # Check if the node is an example group and set the counter.
         # For an example group the following code is produced by pandoc:
         # ```latex
@@ -327,28 +601,27 @@ class Tex2HTMLConverter:
             first_example_no = 1
         if len(node.children) >= 3 and node.children[2].name == 'setcounter':
             first_example_no = int(node.children[2].args[1].contents[0]) + 1
+        result.append(f'<ol{class_attribute}>')
+        separator = ''
         for child in node.children:
             if child.name != 'item':
                 continue
-            tmp = []
-            for item_element in child.contents:
-                # This can be either a text node or an embedded environment.
-                # self.__convert_block can take care of either.
-                item_tree = empty_tree()
-                item_tree.append(item_element)
-                tmp.append(self.__convert_block(item_tree, True))
             if first_example_no is None:
                 # This is a regular list
-                result.append(f'<li>{" ".join(tmp)}</li>')
+                result.append(f'{separator}<li>')
             else:
                 # This is an example list; we need to supply numbers ourselves
-                result.append(f'<li>({first_example_no}) {" ".join(tmp)}</li>')
+                result.append(f'{separator}<li>({first_example_no}) ')
                 first_example_no += 1
-        return f'<ol{class_attribute}>{" ".join(result)}</ol>'
-
-    def longtable(self, node):
-        # Parse node.args to get the number of columns.
-        return ''
+            separator = ' '
+            for i, item_element in enumerate(child.contents):
+                # This can be either a text node or an embedded environment.
+                # self.__convert_block can take care of either.
+                if i:
+                    result.append(' ')
+                self.__convert_block(item_element, result, True)
+            result.append('</li>')
+        result.append('</ol>')
 
     def _get_HTML_arr(self) -> List[str]:
         if self.HTML_arr is None:
@@ -362,77 +635,108 @@ class Tex2HTMLConverter:
             self.__convert()
         return ''.join(self.HTML_arr)
 
+    def write_to(self, file_obj, separator: str = '') -> None:
+        '''
+        Writes the HTML to file_obj block by block. Unless get_HTML was
+        called before, the blocks are converted on the fly and are not
+        kept in memory.
+        '''
+        if self.HTML_arr is not None:
+            chunks = self.HTML_arr
+        else:
+            chunks = self._iter_HTML()
+        for i, chunk in enumerate(chunks):
+            if i:
+                file_obj.write(separator)
+            file_obj.write(chunk)
 
-def empty_tree():
-    return TexSoup.TexSoup('')
 
+def convert_simple_paragraph(block):
+    '''
+    A fast path for paragraphs consisting of plain text, possibly nested
+    inline markup, and escaped square brackets, which make up most of a
+    typical document. The block is tokenised with a single regex instead
+    of being parsed with TexSoup, and the result is the same as that of
+    the general conversion. None is returned for blocks outside of
+    this subset, which should then be parsed with TexSoup. The HTML
+    is returned as a list of fragments, like Tex2HTMLConverter's
+    block conversion does.
+    '''
+    result = ['<p>']
+    append = result.append
+    # Closing tags of the commands whose arguments are open
+    closing_tags = []
+    separate = True
+    for match in _SIMPLE_TOKEN_RE.finditer(block):
+        command, bracket, argument_end, text, other = match.groups()
+        if text is not None:
+            # TexSoup drops whitespace-only text
+            text = text.strip()
+            if text:
+                if separate:
+                    append(' ')
+                separate = True
+                append(text)
+        elif command is not None:
+            tags = _INLINE_TAGS.get(command)
+            if tags is None:
+                return None
+            if separate:
+                append(' ')
+            append(tags[0])
+            closing_tags.append(tags[1])
+            separate = False
+        elif argument_end is not None:
+            if not closing_tags or _ARGUMENT_AHEAD_RE.match(block, match.end()):
+                return None
+            append(closing_tags.pop())
+            separate = True
+        elif bracket is not None:
+            # A block starting with a brace group is an escape sequence
+            if len(result) == 1:
+                return None
+            if separate:
+                append(' ')
+            separate = True
+            append('<span class="BraceGroup">')
+            append(bracket)
+            append('</span>')
+        else:
+            return None
+    if closing_tags or len(result) == 1:
+        return None
+    append(' </p>')
+    return result
 
-def preprocess(txt):
-    preprocessing_dict = {
-        # Preserve intentional spaces
-        '\\textless{} ': '&lt;_',
-        '\\textless{}': '&lt;',
-        '\\textless ': '&lt;_',
-        '\\textless': '&lt;',
-        ' \\textgreater{}': '_&gt;',
-        '\\textgreater{}': '&gt;',
-        ' \\textgreater': '_&gt;',
-        '\\textgreater': '&gt;',
-        '\\ldots{}': '…',
-        '\\ldots': '…',
-        '\\_': '_',
-        '\\#': '#',
-        '---': '—',
-        ' -- ': ' — ',
-        '--': '–',
-        '~': '&nbsp;',
-        ' —': '&nbsp;—'
-    }
-    for k, v in preprocessing_dict.items():
+
+def _get_special_block_command(block):
+    '''
+    Returns the command starting a block that is not converted as
+    regular LaTeX (see _SPECIAL_BLOCK_COMMANDS), or None. Such blocks
+    start with a backslash, so most paragraphs are ruled out by their
+    first character alone.
+    '''
+    if block[:1] == '\\':
+        for command in _SPECIAL_BLOCK_COMMANDS:
+            if block.startswith(command):
+                return command
+    return None
+
+
+def _apply_replacement_stages(chars, compiled_stages, txt):
+    for k, v in chars.items():
         txt = txt.replace(k, v)
+    for pattern, replacements in compiled_stages:
+        txt = pattern.sub(lambda m: replacements[m.group(0)], txt)
     return txt
 
 
+def preprocess(txt):
+    return _apply_replacement_stages(preprocessing_chars, _PRE_RES, txt)
+
+
 def postprocess(txt):
-    postprocessing_dict = {
-        '> .': '>.',
-        '&gt; .': '&gt;.',
-        '> »': '>»',
-        '&gt; »': '&gt;»',
-        '> ,': '>,',
-        '&gt; ,': '&gt;,',
-        '> ;': '>;',
-        '&gt; ;': '&gt;;',
-        '> ?': '>?',
-        '&gt; ?': '&gt;?',
-        '> !': '>!',
-        '&gt; !': '&gt;!',
-        '> )': '>)',
-        '&gt; )': '&gt;)',
-        '( <': '(<',
-        '( &lt;': '(&lt;',
-        '* <': '*<',
-        '* &lt;': '*&lt;',
-        '`': '‘',
-        "'": '’',
-        "&nbsp; ": '&nbsp;',
-        '[</span> ': '[</span>',
-        ' <span class="BraceGroup">]': '<span class="BraceGroup">]',
-        ' <span id="foot': '<span id="foot',
-        '[ ': '[',
-        ' ]': ']',
-        '( ': '(',
-        ' )': ')',
-        '&lt; ': '&lt;',
-        ' &gt;': '&gt;',
-        '<sup>?</sup> ': '<sup>?</sup>',
-        # Restore intentional spaces
-        '&lt;_': '&lt; ',
-        '_&gt;': ' &gt;'
-    }
-    for k, v in postprocessing_dict.items():
-        txt = txt.replace(k, v)
-    return txt
+    return _apply_replacement_stages(postprocessing_chars, _POST_RES, txt)
 
 
 def convert_example(txt, example_number):
@@ -450,9 +754,7 @@ if __name__ == '__main__':
             header = inp.read()
         with open(opj('templates', 'base.html'), 'r', encoding='utf-8') as inp:
             template = inp.read()
-            out.write(
-                template.replace(
-                    '{{main}}',
-                    '\n'.join(coverter_instance._get_HTML_arr())
-                ).replace('{{header}}', header)
-            )
+        before_main, after_main = template.split('{{main}}', 1)
+        out.write(before_main.replace('{{header}}', header))
+        coverter_instance.write_to(out, '\n')
+        out.write(after_main.replace('{{header}}', header))
@@ -13,3 +13,125 @@ for el in ts.contents:
         print(repr(el.contents))
     else:
         print(repr(el))
+
+
+# The staged replacements in converter must give the same result as
+# applying the same replacements one by one, in table order.
+import itertools
+import converter
+
+
+def apply_sequentially(chars, stages, txt):
+    for replacements in [chars] + stages:
+        for k, v in replacements.items():
+            txt = txt.replace(k, v)
+    return txt
+
+
+def check_replacement_stages(chars, stages, compiled_stages):
+    keys = list(chars) + [k for stage in stages for k in stage]
+    # Single characters catch keys completed by a neighbouring key's output
+    pieces = keys + sorted(set(''.join(keys)))
+    inputs = itertools.chain(
+        (''.join(p) for p in itertools.product(pieces, repeat=2)),
+        (''.join(p) for p in itertools.product(keys, repeat=3)))
+    mismatches = 0
+    for txt in inputs:
+        expected = apply_sequentially(chars, stages, txt)
+        actual = converter._apply_replacement_stages(
+            chars, compiled_stages, txt)
+        if actual != expected:
+            mismatches += 1
+            print(repr(txt), repr(expected), repr(actual))
+    return mismatches
+
+
+# The fast path for simple paragraphs must give the same HTML as the
+# general conversion of the TexSoup tree for every block it accepts.
+def convert_with_TexSoup(block):
+    result = []
+    converter.Tex2HTMLConverter('')._Tex2HTMLConverter__convert_nodes(
+        TexSoup.TexSoup(block).contents, result)
+    return ''.join(result)
+
+
+def check_simple_paragraphs(blocks):
+    accepted = mismatches = 0
+    for block in blocks:
+        simple_paragraph = converter.convert_simple_paragraph(block)
+        if simple_paragraph is None:
+            continue
+        accepted += 1
+        expected = convert_with_TexSoup(block)
+        if ''.join(simple_paragraph) != expected:
+            mismatches += 1
+            print(repr(block), repr(expected), repr(''.join(simple_paragraph)))
+    return accepted, mismatches
+
+
+paragraph_pieces = [
+    'a', 'b c', ' ', '\n', '&nbsp;', 'x_y', '#', ':', '.', ' — ', "''",
+    '{[}', '{]}', '\\textit{', '\\textbf{', '\\underline{',
+    '\\textsuperscript{', '}', '\\textit{x}', '\\textit{ }', '\\textit{}',
+    '\\textit{a \\textbf{b} c}', '\\textit {q}', '\\foo{a}', '[', '{', '$'
+]
+
+# Converting blocks in worker processes must not change the output.
+# A document touching all kinds of blocks and all of the bookkeeping.
+worker_document = r'''\tableofcontents
+
+\section{Title\footnote{note \textit{in} heading}}
+
+Plain text, \textit{nested \textbf{markup}} and {[}brackets{]}.
+
+\subsection{Sub\label{sub}}
+
+Text with a footnote\footnote{A \underline{footnote}.} and \textsc{caps}.
+
+\ex. An example
+
+\begin{itemize}
+\item First \textit{item}
+\item Second item
+\end{itemize}
+
+\subsubsection{Subsub}
+
+Another paragraph~--- with a dash.
+'''
+
+
+if __name__ == '__main__':
+    assert check_replacement_stages(converter.preprocessing_chars,
+                                    converter.preprocessing_stages,
+                                    converter._PRE_RES) == 0
+    assert check_replacement_stages(converter.postprocessing_chars,
+                                    converter.postprocessing_stages,
+                                    converter._POST_RES) == 0
+
+    # A footnote in a heading is registered once (the contents of headings
+    # used to be rendered twice, which numbered such footnotes twice).
+    heading_converter = converter.Tex2HTMLConverter(
+        r'\section{Title\footnote{note}}')
+    heading_HTML = heading_converter.get_HTML()
+    assert len(heading_converter.footnotes) == 1
+    assert 'footnoteanchor1' in heading_HTML
+    assert 'footnoteanchor2' not in heading_HTML
+
+    paragraphs = itertools.chain(
+        paragraph_pieces,
+        (''.join(p) for p in itertools.product(paragraph_pieces, repeat=2)),
+        (''.join(p) for p in itertools.product(paragraph_pieces, repeat=3)))
+    accepted, mismatches = check_simple_paragraphs(paragraphs)
+    assert accepted and mismatches == 0
+    # Blocks that TexSoup reads differently are left to it: a group after
+    # a command's argument is taken as another argument, and a leading
+    # brace group is an escape sequence.
+    for block in ['\\textit{a}{b}', '\\textit{a} [b]', '\\textit{a} {[}b{]}',
+                  '{[}a{]} b', '\\textit{a', 'a}', '\\footnote{a}']:
+        assert converter.convert_simple_paragraph(block) is None, block
+
+    serial_HTML = converter.Tex2HTMLConverter(worker_document).get_HTML()
+    parallel_HTML = converter.Tex2HTMLConverter(
+        worker_document, workers=2).get_HTML()
+    assert parallel_HTML == serial_HTML